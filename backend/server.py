@@ -1,38 +1,128 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Depends, Header
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.write_concern import WriteConcern
 import os
+import time
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, List
+from typing import Optional, List, Dict, Callable
+from collections import OrderedDict
 import secrets
 import hashlib
+import hmac
 from datetime import datetime, timezone, timedelta
-
-# Rate limiting
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
 from starlette.responses import JSONResponse
 
 # File size limit (10MB)
 MAX_FILE_SIZE = 10 * 1024 * 1024
 
+# Window for coalescing concurrent secret info lookups into one query
+INFO_BATCH_WINDOW = 0.005
+
+# Upper bound on tracked clients per rate-limited endpoint
+RATE_LIMIT_MAX_BUCKETS = 10000
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    tz_aware=True,
+    # Each request does a single Mongo op, so a small warm pool is enough
+    maxPoolSize=25,
+    minPoolSize=5,
+    serverSelectionTimeoutMS=5000,
+    socketTimeoutMS=10000
+)
 db = client[os.environ['DB_NAME']]
 
+# Secrets are short-lived and can simply be re-shared, so inserts skip waiting
+# for the journal. Deletes keep the default so consumed one-time secrets stay gone.
+secret_inserts = db.secrets.with_options(write_concern=WriteConcern(w=1, j=False))
+
+# Opt-in batching of GET /secrets/{id} lookups for read-heavy deployments
+BATCH_INFO_LOOKUPS = os.environ.get('BATCH_INFO_LOOKUPS', 'false').lower() == 'true'
+
+# Proxy addresses whose X-Forwarded-For header is trusted for rate limiting
+TRUSTED_PROXIES = frozenset(
+    proxy.strip() for proxy in os.environ.get('TRUSTED_PROXIES', '').split(',') if proxy.strip()
+)
+
+# Server-side key for PIN hashes, so a leaked database can't be replayed
+PIN_HMAC_KEY = os.environ['PIN_HMAC_KEY'].encode()
+# Keyed once at import; each PIN check copies it instead of re-deriving the key pads
+_pin_hmac = hmac.new(PIN_HMAC_KEY, digestmod=hashlib.sha256)
+_token_urlsafe = secrets.token_urlsafe
+
 # Rate limiter
-limiter = Limiter(key_func=get_remote_address)
+class RateLimitExceeded(Exception):
+    pass
+
+class TokenBucket:
+    __slots__ = ("tokens", "last")
+
+    def __init__(self, tokens: float, last: float):
+        self.tokens = tokens
+        self.last = last
+
+    def allow(self, now: float, rate: float, capacity: float) -> bool:
+        """Refill for the time elapsed since the last call, then take a token"""
+        self.tokens = min(capacity, self.tokens + (now - self.last) * rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+def client_ip(request: Request, x_forwarded_for: Optional[str]) -> str:
+    """Real client address, honouring X-Forwarded-For only from trusted proxies"""
+    peer = request.client.host if request.client else ""
+    # The right-most entry is the one our proxy appended; earlier ones are client-controlled
+    if x_forwarded_for and peer in TRUSTED_PROXIES:
+        forwarded = x_forwarded_for.rsplit(",", 1)[-1].strip()
+        if forwarded:
+            return forwarded
+    return peer
+
+def rate_limit(limit: int, per: float) -> Callable:
+    """Dependency allowing `limit` requests per `per` seconds for each client IP"""
+    rate = limit / per
+    # Least recently seen client first, so idle buckets are always at the front
+    buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    async def check(request: Request, x_forwarded_for: Optional[str] = Header(None)):
+        now = time.monotonic()
+        key = client_ip(request, x_forwarded_for)
+
+        # A bucket idle for `per` seconds has refilled completely, so dropping it is lossless
+        while buckets:
+            oldest = next(iter(buckets.values()))
+            if now - oldest.last < per:
+                break
+            buckets.popitem(last=False)
+
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= RATE_LIMIT_MAX_BUCKETS:
+                # Full of active clients: evict the least recently seen one
+                buckets.popitem(last=False)
+            bucket = buckets[key] = TokenBucket(limit, now)
+        else:
+            buckets.move_to_end(key)
+        if not bucket.allow(now, rate, limit):
+            raise RateLimitExceeded()
+
+    return check
 
 # Create the main app
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Add rate limit error handler
 @app.exception_handler(RateLimitExceeded)
@@ -42,12 +132,10 @@ async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
         content={"error": "Too many requests. Please try again later."}
     )
 
-app.state.limiter = limiter
-
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# Models
+# Request models. Responses are plain dicts built from server-side data.
 class FileData(BaseModel):
     encrypted_data: str
     iv: str
@@ -63,41 +151,83 @@ class SecretCreate(BaseModel):
     one_time_view: bool = False
     files: Optional[List[FileData]] = None
 
-class SecretResponse(BaseModel):
-    id: str
-    message: str
+class PinVerify(BaseModel):
+    pin_hash: Optional[str] = None
 
-class FileFetch(BaseModel):
-    encrypted_data: str
-    iv: str
-    filename: str
-    file_type: str
-    file_size: int
+# Fields needed to describe a secret without its encrypted payloads
+SECRET_INFO_PROJECTION = {
+    "_id": 0,
+    "pin_hash": 1,
+    "one_time_view": 1,
+    "expires_at": 1,
+    "files.filename": 1,
+    "files.file_type": 1,
+    "files.file_size": 1
+}
 
-class SecretFetch(BaseModel):
-    encrypted_data: str
-    iv: str
-    one_time_view: bool
-    expires_at: str
-    has_pin: bool
-    files: Optional[List[FileFetch]] = None
+# Match a secret that has not expired yet. The TTL monitor only runs about
+# once a minute, so expired documents can still be present briefly.
+def live_secret_query(secret_id: str) -> dict:
+    return {"id": secret_id, "expires_at": {"$gt": datetime.now(timezone.utc)}}
 
-class PinVerify(BaseModel):
-    pin_hash: Optional[str] = None
+# Pending info lookups waiting for the next batched query, keyed by secret id
+_pending_info_lookups: Dict[str, asyncio.Future] = {}
+_info_flush_task: Optional[asyncio.Task] = None
+
+async def _flush_info_lookups():
+    """Resolve all pending info lookups with a single $in query"""
+    await asyncio.sleep(INFO_BATCH_WINDOW)
+    pending = dict(_pending_info_lookups)
+    _pending_info_lookups.clear()
+    
+    try:
+        docs = await db.secrets.find(
+            {"id": {"$in": list(pending)}, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+            {**SECRET_INFO_PROJECTION, "id": 1}
+        ).to_list(None)
+    except Exception as exc:
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(exc)
+                # Mark it retrieved in case every waiter was cancelled meanwhile
+                future.exception()
+        return
+    
+    found = {doc["id"]: doc for doc in docs}
+    for secret_id, future in pending.items():
+        if not future.done():
+            future.set_result(found.get(secret_id))
+
+async def find_secret_info(secret_id: str) -> Optional[dict]:
+    """Fetch a live secret's metadata, batching with concurrent lookups if enabled"""
+    if not BATCH_INFO_LOOKUPS:
+        return await db.secrets.find_one(live_secret_query(secret_id), SECRET_INFO_PROJECTION)
+    
+    global _info_flush_task
+    future = _pending_info_lookups.get(secret_id)
+    if future is None:
+        if not _pending_info_lookups:
+            _info_flush_task = asyncio.create_task(_flush_info_lookups())
+        future = asyncio.get_running_loop().create_future()
+        _pending_info_lookups[secret_id] = future
+    # Shield so one cancelled request doesn't cancel the lookup for other waiters
+    return await asyncio.shield(future)
 
-# Helper to generate secure random token (32 bytes = 64 hex chars)
+# Helper to generate secure random token (32 bytes = 43 URL-safe base64 chars)
 def generate_secure_token() -> str:
-    return secrets.token_hex(32)
+    return _token_urlsafe(32)
 
-# Helper to hash PIN for comparison
-def hash_pin(pin: str) -> str:
-    return hashlib.sha256(pin.encode()).hexdigest()
+# Helper to key the client's PIN hash before storing or comparing it
+def hmac_pin_hash(pin_hash: str) -> str:
+    mac = _pin_hmac.copy()
+    mac.update(pin_hash.encode())
+    return mac.hexdigest()
 
 @api_router.get("/")
 async def root():
     return {"message": "CipherShare API - Secure Secret Sharing"}
 
-@api_router.post("/secrets", response_model=SecretResponse)
+@api_router.post("/secrets")
 async def create_secret(secret: SecretCreate):
     """Create a new encrypted secret"""
     # Validate file sizes
@@ -107,134 +237,113 @@ async def create_secret(secret: SecretCreate):
             raise HTTPException(status_code=413, detail=f"Total file size exceeds {MAX_FILE_SIZE // (1024*1024)}MB limit")
     
     token = generate_secure_token()
-    expires_at = datetime.now(timezone.utc) + timedelta(minutes=secret.expiry_minutes)
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(minutes=secret.expiry_minutes)
     
     # Prepare files data
     files_data = None
     if secret.files:
-        files_data = [
-            {
-                "encrypted_data": f.encrypted_data,
-                "iv": f.iv,
-                "filename": f.filename,
-                "file_type": f.file_type,
-                "file_size": f.file_size
-            }
-            for f in secret.files
-        ]
+        files_data = [f.model_dump() for f in secret.files]
     
     doc = {
         "id": token,
         "encrypted_data": secret.encrypted_data,
         "iv": secret.iv,
-        "pin_hash": secret.pin_hash,
+        "pin_hash": hmac_pin_hash(secret.pin_hash) if secret.pin_hash else None,
         "expiry_minutes": secret.expiry_minutes,
         "one_time_view": secret.one_time_view,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "expires_at": expires_at.isoformat(),
-        "viewed": False,
+        "created_at": now,
+        "expires_at": expires_at,
         "files": files_data
     }
     
-    await db.secrets.insert_one(doc)
+    await secret_inserts.insert_one(doc)
     
-    return SecretResponse(
-        id=token,
-        message="Secret created successfully"
-    )
+    return {
+        "id": token,
+        "message": "Secret created successfully"
+    }
 
-@api_router.get("/secrets/{secret_id}")
-@limiter.limit("10/minute")
-async def get_secret_info(request: Request, secret_id: str):
+@api_router.get("/secrets/{secret_id}", dependencies=[Depends(rate_limit(10, 60))])
+async def get_secret_info(secret_id: str):
     """Check if secret exists and if it requires a PIN"""
-    secret = await db.secrets.find_one({"id": secret_id}, {"_id": 0})
+    # Skip the ciphertext fields; only metadata is returned here
+    secret = await find_secret_info(secret_id)
     
     if not secret:
         raise HTTPException(status_code=404, detail="Secret not found or has expired")
     
-    # Check if expired
-    expires_at = datetime.fromisoformat(secret["expires_at"])
-    if datetime.now(timezone.utc) > expires_at:
-        await db.secrets.delete_one({"id": secret_id})
-        raise HTTPException(status_code=410, detail="Secret has expired")
-    
-    # Check if already viewed (one-time view)
-    if secret.get("one_time_view") and secret.get("viewed"):
-        await db.secrets.delete_one({"id": secret_id})
-        raise HTTPException(status_code=410, detail="Secret has already been viewed")
+    is_one_time = secret.get("one_time_view", False)
+    files = secret.get("files")
     
     # Get file info without encrypted data
     files_info = None
-    if secret.get("files"):
+    if files:
         files_info = [
             {"filename": f["filename"], "file_type": f["file_type"], "file_size": f["file_size"]}
-            for f in secret["files"]
+            for f in files
         ]
     
+    expires_at = secret["expires_at"]
     return {
         "has_pin": secret.get("pin_hash") is not None,
-        "one_time_view": secret.get("one_time_view", False),
-        "expires_at": secret["expires_at"],
-        "has_files": secret.get("files") is not None and len(secret.get("files", [])) > 0,
+        "one_time_view": is_one_time,
+        "expires_at": expires_at,
+        "expires_at_epoch": int(expires_at.timestamp()),
+        "has_files": bool(files),
         "files_info": files_info
     }
 
-@api_router.post("/secrets/{secret_id}/view")
-@limiter.limit("5/minute")
-async def view_secret(request: Request, secret_id: str, pin_data: PinVerify = PinVerify()):
+@api_router.post("/secrets/{secret_id}/view", dependencies=[Depends(rate_limit(5, 60))])
+async def view_secret(secret_id: str, pin_data: PinVerify = PinVerify()):
     """View and decrypt a secret (with optional PIN verification)"""
-    secret = await db.secrets.find_one({"id": secret_id}, {"_id": 0})
+    secret = await db.secrets.find_one(live_secret_query(secret_id), {"_id": 0})
     
     if not secret:
         raise HTTPException(status_code=404, detail="Secret not found or has expired")
     
-    # Check if expired
-    expires_at = datetime.fromisoformat(secret["expires_at"])
-    if datetime.now(timezone.utc) > expires_at:
-        await db.secrets.delete_one({"id": secret_id})
-        raise HTTPException(status_code=410, detail="Secret has expired")
-    
-    # Check if already viewed (one-time view)
-    if secret.get("one_time_view") and secret.get("viewed"):
-        await db.secrets.delete_one({"id": secret_id})
-        raise HTTPException(status_code=410, detail="Secret has already been viewed")
+    pin_hash = secret.get("pin_hash")
+    is_one_time = secret.get("one_time_view", False)
     
     # Verify PIN if required
-    if secret.get("pin_hash"):
+    if pin_hash:
         if not pin_data or not pin_data.pin_hash:
             raise HTTPException(status_code=401, detail="PIN required")
-        if pin_data.pin_hash != secret["pin_hash"]:
+        if not hmac.compare_digest(hmac_pin_hash(pin_data.pin_hash).encode(), pin_hash.encode()):
             raise HTTPException(status_code=401, detail="Invalid PIN")
     
-    # Mark as viewed if one-time view
-    if secret.get("one_time_view"):
-        await db.secrets.update_one(
-            {"id": secret_id},
-            {"$set": {"viewed": True}}
-        )
+    # Consume one-time secrets; only the viewer whose delete succeeds gets the payload
+    if is_one_time:
+        result = await db.secrets.delete_one({"id": secret_id})
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=410, detail="Secret has already been viewed")
+    
+    expires_at = secret["expires_at"]
     
     # Prepare files data
+    files = secret.get("files")
     files_data = None
-    if secret.get("files"):
+    if files:
         files_data = [
-            FileFetch(
-                encrypted_data=f["encrypted_data"],
-                iv=f["iv"],
-                filename=f["filename"],
-                file_type=f["file_type"],
-                file_size=f["file_size"]
-            )
-            for f in secret["files"]
+            {
+                "encrypted_data": f["encrypted_data"],
+                "iv": f["iv"],
+                "filename": f["filename"],
+                "file_type": f["file_type"],
+                "file_size": f["file_size"]
+            }
+            for f in files
         ]
     
-    return SecretFetch(
-        encrypted_data=secret["encrypted_data"],
-        iv=secret["iv"],
-        one_time_view=secret.get("one_time_view", False),
-        expires_at=secret["expires_at"],
-        has_pin=secret.get("pin_hash") is not None,
-        files=files_data
-    )
+    return {
+        "encrypted_data": secret["encrypted_data"],
+        "iv": secret["iv"],
+        "one_time_view": is_one_time,
+        "expires_at": expires_at,
+        "expires_at_epoch": int(expires_at.timestamp()),
+        "has_pin": pin_hash is not None,
+        "files": files_data
+    }
 
 @api_router.delete("/secrets/{secret_id}")
 async def delete_secret(secret_id: str):
@@ -246,24 +355,18 @@ async def delete_secret(secret_id: str):
     
     return {"message": "Secret deleted successfully"}
 
-# Cleanup expired secrets (can be called periodically)
-@api_router.post("/cleanup")
-async def cleanup_expired_secrets():
-    """Remove expired secrets from the database"""
-    current_time = datetime.now(timezone.utc).isoformat()
-    result = await db.secrets.delete_many({
-        "expires_at": {"$lt": current_time}
-    })
-    
-    return {"deleted_count": result.deleted_count}
-
 # Include the router in the main app
 app.include_router(api_router)
 
+# Allowed origins as a set so CORSMiddleware's per-request check is a hash lookup
+CORS_ORIGINS = frozenset(
+    origin.strip() for origin in os.environ.get('CORS_ORIGINS', '*').split(',')
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+    allow_origins=CORS_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
 )
@@ -275,6 +378,37 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def migrate_legacy_secrets():
+    """Bring secrets written by older versions in line with the current schema"""
+    # Older versions kept one-time secrets after their first view, flagged viewed=True
+    await db.secrets.delete_many({"viewed": True})
+    await db.secrets.update_many({"viewed": {"$exists": True}}, {"$unset": {"viewed": ""}})
+    
+    # Documents with a string expires_at predate both BSON dates and keyed PIN hashes.
+    # The TTL index and live_secret_query only match dates, so these would never expire,
+    # and their pin_hash is still the raw client SHA256. Filtering on the old string
+    # makes each conversion happen exactly once, even with several workers starting.
+    legacy = db.secrets.find(
+        {"expires_at": {"$type": "string"}},
+        {"_id": 1, "expires_at": 1, "pin_hash": 1}
+    )
+    async for doc in legacy:
+        pin_hash = doc.get("pin_hash")
+        await db.secrets.update_one(
+            {"_id": doc["_id"], "expires_at": doc["expires_at"]},
+            {"$set": {
+                "expires_at": datetime.fromisoformat(doc["expires_at"]),
+                "pin_hash": hmac_pin_hash(pin_hash) if pin_hash else None
+            }}
+        )
+
+@app.on_event("startup")
+async def create_indexes():
+    await db.secrets.create_index("id", unique=True)
+    # TTL index: MongoDB removes secrets once expires_at has passed
+    await db.secrets.create_index("expires_at", expireAfterSeconds=0)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
@@ -202,13 +202,13 @@ class CipherShareAPITester:
         if not success1:
             return False
         
-        # Second view should fail (410 - Gone)
+        # Second view should fail (404 - deleted on first view)
         time.sleep(1)  # Small delay
         success2, response2 = self.run_test(
             "One-Time View (Second Attempt)",
             "POST",
             f"secrets/{secret_id}/view",
-            410,
+            404,
             data={}
         )
         return success2
@@ -223,16 +223,6 @@ class CipherShareAPITester:
         )
         return success
 
-    def test_cleanup_endpoint(self):
-        """Test the cleanup endpoint"""
-        success, response = self.run_test(
-            "Cleanup Expired Secrets",
-            "POST",
-            "cleanup",
-            200
-        )
-        return success
-
     def test_create_secret_with_files(self):
         """Test creating a secret with files"""
         # Mock encrypted file data
@@ -484,10 +474,7 @@ class CipherShareAPITester:
         # Test 17: Invalid data
         self.test_invalid_data()
         
-        # Test 18: Cleanup endpoint
-        self.test_cleanup_endpoint()
-        
-        # Test 19: Delete remaining secrets
+        # Test 18: Delete remaining secrets
         for secret_id in self.created_secrets:
             if secret_id not in [one_time_secret_id]:  # Skip already deleted
                 self.test_delete_secret(secret_id)
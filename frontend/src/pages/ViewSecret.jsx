@@ -57,8 +57,6 @@ export default function ViewSecret() {
       console.error('Error fetching secret info:', err);
       if (err.response?.status === 404) {
         setError('not_found');
-      } else if (err.response?.status === 410) {
-        setError('expired');
       } else {
         setError('unknown');
       }
@@ -113,9 +111,8 @@ export default function ViewSecret() {
       console.error('Error viewing secret:', err);
       if (err.response?.status === 401) {
         toast.error('Invalid PIN. Please try again.');
-      } else if (err.response?.status === 410) {
-        setError('expired');
-      } else if (err.response?.status === 404) {
+      } else if (err.response?.status === 404 || err.response?.status === 410) {
+        // 410 means another viewer consumed this one-time secret first
         setError('not_found');
       } else {
         toast.error('Failed to retrieve secret');
@@ -175,20 +172,18 @@ export default function ViewSecret() {
         animate={{ opacity: 1, y: 0 }}
         className="w-full max-w-xl mx-auto text-center"
       >
-        <div className={`glass rounded-xl p-8 ${error === 'expired' ? 'error-state' : ''}`}>
+        <div className="glass rounded-xl p-8">
           <div className="inline-flex p-4 rounded-full bg-red-500/10 border border-red-500/20 mb-6">
             <AlertTriangle className="w-10 h-10 text-red-400" />
           </div>
           
           <h1 className="font-unbounded text-2xl font-bold text-slate-100 mb-3">
             {error === 'not_found' && 'Secret Not Found'}
-            {error === 'expired' && 'Secret Expired'}
             {error === 'unknown' && 'Something Went Wrong'}
           </h1>
           
           <p className="text-slate-400 mb-8">
-            {error === 'not_found' && 'This secret does not exist or has already been viewed.'}
-            {error === 'expired' && 'This secret has expired and is no longer available.'}
+            {error === 'not_found' && 'This secret does not exist, has expired, or has already been viewed.'}
             {error === 'unknown' && 'Unable to retrieve the secret. Please try again later.'}
           </p>
           
@@ -348,7 +343,7 @@ export default function ViewSecret() {
         <div className="flex flex-wrap items-center justify-center gap-4 mb-6 text-sm">
           <div className="flex items-center gap-2 text-slate-400">
             <Clock className="w-4 h-4" />
-            <span>Expires: {new Date(secretInfo?.expires_at).toLocaleString()}</span>
+            <span>Expires: {new Date(secretInfo?.expires_at_epoch * 1000).toLocaleString()}</span>
           </div>
           {secretInfo?.one_time_view && (
             <div className="flex items-center gap-2 text-amber-400">
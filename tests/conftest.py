@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+# server.py reads these at import time; the Motor client connects lazily
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "ciphershare_test")
+os.environ.setdefault("PIN_HMAC_KEY", "test-pin-key")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
@@ -0,0 +1,126 @@
+import asyncio
+import gc
+
+import pytest
+
+import server
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return self.docs
+
+
+class FakeSecrets:
+    def __init__(self, docs=(), error=None):
+        # Exception type, raised fresh per call so no instance outlives the test
+        self.docs = {doc["id"]: doc for doc in docs}
+        self.error = error
+        self.find_calls = []
+        self.find_one_calls = []
+
+    def find(self, query, projection):
+        self.find_calls.append(query)
+        if self.error:
+            raise self.error("mongo down")
+        return FakeCursor([self.docs[i] for i in query["id"]["$in"] if i in self.docs])
+
+    async def find_one(self, query, projection):
+        self.find_one_calls.append(query)
+        return self.docs.get(query["id"])
+
+
+@pytest.fixture
+def use_secrets(monkeypatch):
+    def install(secrets):
+        monkeypatch.setattr(server, "db", type("FakeDB", (), {"secrets": secrets})())
+        return secrets
+    monkeypatch.setattr(server, "BATCH_INFO_LOOKUPS", True)
+    return install
+
+
+def test_concurrent_lookups_share_one_query(use_secrets):
+    secrets = use_secrets(FakeSecrets([{"id": "a", "one_time_view": True}, {"id": "b", "one_time_view": False}]))
+
+    async def run():
+        return await asyncio.gather(
+            server.find_secret_info("a"),
+            server.find_secret_info("b"),
+            server.find_secret_info("missing"),
+        )
+
+    a, b, missing = asyncio.run(run())
+    assert a["one_time_view"] is True
+    assert b["one_time_view"] is False
+    assert missing is None
+    assert len(secrets.find_calls) == 1
+    assert sorted(secrets.find_calls[0]["id"]["$in"]) == ["a", "b", "missing"]
+
+
+def test_duplicate_ids_are_queried_once(use_secrets):
+    secrets = use_secrets(FakeSecrets([{"id": "a"}]))
+
+    async def run():
+        return await asyncio.gather(server.find_secret_info("a"), server.find_secret_info("a"))
+
+    first, second = asyncio.run(run())
+    assert first == second == {"id": "a"}
+    assert secrets.find_calls[0]["id"]["$in"] == ["a"]
+
+
+def test_query_error_reaches_every_waiter(use_secrets):
+    use_secrets(FakeSecrets(error=RuntimeError))
+
+    async def run():
+        return await asyncio.gather(
+            server.find_secret_info("a"),
+            server.find_secret_info("b"),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_cancelled_waiter_does_not_affect_others(use_secrets):
+    use_secrets(FakeSecrets([{"id": "a"}]))
+
+    async def run():
+        cancelled = asyncio.create_task(server.find_secret_info("a"))
+        survivor = asyncio.create_task(server.find_secret_info("a"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        result = await survivor
+        assert cancelled.cancelled()
+        return result
+
+    assert asyncio.run(run()) == {"id": "a"}
+
+
+def test_error_with_all_waiters_cancelled_is_not_logged(use_secrets):
+    use_secrets(FakeSecrets(error=RuntimeError))
+    unhandled = []
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, ctx: unhandled.append(ctx))
+        waiter = asyncio.create_task(server.find_secret_info("a"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        del waiter
+        await asyncio.sleep(server.INFO_BATCH_WINDOW * 4)
+        gc.collect()
+
+    asyncio.run(run())
+    assert unhandled == []
+
+
+def test_batching_disabled_uses_find_one(use_secrets, monkeypatch):
+    secrets = use_secrets(FakeSecrets([{"id": "a"}]))
+    monkeypatch.setattr(server, "BATCH_INFO_LOOKUPS", False)
+
+    assert asyncio.run(server.find_secret_info("a")) == {"id": "a"}
+    assert secrets.find_calls == []
+    assert len(secrets.find_one_calls) == 1
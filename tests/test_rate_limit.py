@@ -0,0 +1,125 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(server.time, "monotonic", clock)
+    return clock
+
+
+def make_request(host):
+    return SimpleNamespace(client=SimpleNamespace(host=host))
+
+
+def allowed(check, host, x_forwarded_for=None):
+    try:
+        asyncio.run(check(make_request(host), x_forwarded_for))
+    except server.RateLimitExceeded:
+        return False
+    return True
+
+
+def test_token_bucket_starts_full_then_denies():
+    bucket = server.TokenBucket(3, 0.0)
+    assert [bucket.allow(0.0, 1.0, 3) for _ in range(4)] == [True, True, True, False]
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = server.TokenBucket(0, 0.0)
+    assert not bucket.allow(0.5, 1.0, 3)
+    assert bucket.allow(1.0, 1.0, 3)
+    assert not bucket.allow(1.0, 1.0, 3)
+
+
+def test_token_bucket_never_exceeds_capacity():
+    bucket = server.TokenBucket(0, 0.0)
+    results = [bucket.allow(3600.0, 1.0, 2) for _ in range(3)]
+    assert results == [True, True, False]
+
+
+def test_rate_limit_blocks_after_limit(clock):
+    check = server.rate_limit(5, 60)
+    assert [allowed(check, "1.1.1.1") for _ in range(6)] == [True] * 5 + [False]
+
+
+def test_rate_limit_is_per_client(clock):
+    check = server.rate_limit(1, 60)
+    assert allowed(check, "1.1.1.1")
+    assert not allowed(check, "1.1.1.1")
+    assert allowed(check, "2.2.2.2")
+
+
+def test_rate_limit_refills_over_time(clock):
+    check = server.rate_limit(5, 60)
+    for _ in range(5):
+        assert allowed(check, "1.1.1.1")
+    assert not allowed(check, "1.1.1.1")
+    clock.now += 12
+    assert allowed(check, "1.1.1.1")
+    assert not allowed(check, "1.1.1.1")
+
+
+def test_idle_buckets_are_dropped_without_losing_tokens(clock):
+    check = server.rate_limit(2, 60)
+    assert allowed(check, "1.1.1.1")
+    assert allowed(check, "1.1.1.1")
+    clock.now += 60
+    # Another client's request sweeps the idle bucket; a full fresh one replaces it
+    assert allowed(check, "2.2.2.2")
+    assert [allowed(check, "1.1.1.1") for _ in range(3)] == [True, True, False]
+
+
+def test_bucket_cap_evicts_least_recently_seen(clock, monkeypatch):
+    monkeypatch.setattr(server, "RATE_LIMIT_MAX_BUCKETS", 2)
+    check = server.rate_limit(1, 60)
+    assert allowed(check, "a")
+    assert allowed(check, "b")
+    clock.now += 1
+    # Touching "a" makes "b" the least recently seen client
+    assert not allowed(check, "a")
+    assert allowed(check, "c")
+    assert not allowed(check, "a")
+    assert allowed(check, "b")
+
+
+def test_rate_limit_handler_returns_429():
+    response = asyncio.run(server.rate_limit_handler(None, server.RateLimitExceeded()))
+    assert response.status_code == 429
+    assert json.loads(response.body) == {"error": "Too many requests. Please try again later."}
+
+
+def test_client_ip_ignores_forwarded_for_from_untrusted_peer(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXIES", frozenset({"10.0.0.1"}))
+    assert server.client_ip(make_request("1.2.3.4"), "9.9.9.9") == "1.2.3.4"
+
+
+def test_client_ip_uses_last_forwarded_entry_from_trusted_proxy(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXIES", frozenset({"10.0.0.1"}))
+    assert server.client_ip(make_request("10.0.0.1"), "6.6.6.6, 5.5.5.5") == "5.5.5.5"
+
+
+def test_client_ip_falls_back_to_peer_without_header(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXIES", frozenset({"10.0.0.1"}))
+    assert server.client_ip(make_request("10.0.0.1"), None) == "10.0.0.1"
+    assert server.client_ip(make_request("10.0.0.1"), " ") == "10.0.0.1"
+
+
+def test_spoofed_forwarded_for_does_not_bypass_limit(clock):
+    check = server.rate_limit(2, 60)
+    results = [allowed(check, "1.2.3.4", f"9.9.9.{i}") for i in range(3)]
+    assert results == [True, True, False]